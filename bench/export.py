@@ -0,0 +1,85 @@
+'''
+Measures track export on a scaled-up copy of the sample log, against just
+collecting every TPV in a list.
+
+Each case runs in a fresh interpreter, so the max RSS is its own.
+
+Example:
+  $ python bench/export.py
+  $ python bench/export.py --scale 50 --format geojson --tolerance 0
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, 'sample_nmea', 'GPS_20121104_134730.log')
+
+def child(mode, path, fmt, tolerance):
+    sys.path.insert(0, ROOT)
+    from fixated.file_parser import iter_tpvs
+    from fixated.export import export_track
+
+    start = time.perf_counter()
+    if mode == 'export':
+        with open(os.devnull, 'w') as fh:
+            exp = export_track(iter_tpvs(path), fh, fmt, tolerance=tolerance)
+        detail = '%d fixes -> %d points in %d segments' % (
+                 exp.points_in, exp.points_out, exp.segments)
+    else:
+        tpvs = list(iter_tpvs(path))
+        detail = '%d TPVs' % len(tpvs)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is KiB on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%.2f %d %s' % (elapsed, rss, detail))
+
+def run(mode, path, fmt, tolerance):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__),
+                           '--child', mode, path, '--format', fmt,
+                           '--tolerance', str(tolerance)],
+                          stdout=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+    (elapsed, rss, detail) = proc.stdout.strip().split(' ', 2)
+
+    return (float(elapsed), int(rss), detail)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-s', '--scale', type=int, nargs='+', default=[1, 200],
+            help='Copies of the sample log to concatenate (default: %(default)s)')
+    parser.add_argument('-f', '--format', choices=['gpx', 'geojson'], default='gpx')
+    parser.add_argument('-t', '--tolerance', type=float, default=5.0)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'),
+            help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.format, args.tolerance)
+        return
+
+    tmp = tempfile.mkdtemp()
+    try:
+        for scale in args.scale:
+            path = os.path.join(tmp, 'sample_x%d.log' % scale)
+            with open(path, 'wb') as out:
+                for _ in range(scale):
+                    with open(SAMPLE, 'rb') as fh:
+                        shutil.copyfileobj(fh, out)
+
+            size = os.path.getsize(path) / 1e6
+            for mode in ('export', 'list'):
+                (elapsed, rss, detail) = run(mode, path, args.format, args.tolerance)
+                print('%4dx (%6.1f MB) %-6s %7.2f s, max RSS %7.1f MB  %s' % (
+                      scale, size, mode, elapsed, rss / 1024.0, detail))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
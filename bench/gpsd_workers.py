@@ -0,0 +1,138 @@
+'''
+Measures how many reports per second GpsdWorkerPool delivers to a crowd of
+watching clients, at several worker counts.
+
+Clients connect over TCP and the Unix socket (alternating), from a few load
+generator processes. The parent then publishes epochs from the sample log as
+fast as it can, and the clock stops when every client has seen the last one.
+
+Example:
+  $ python bench/gpsd_workers.py
+  $ python bench/gpsd_workers.py --clients 500 --epochs 100 --workers 1 2 4
+'''
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import selectors
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixated.file_parser import iter_tpvs
+from fixated.gpsd_workers import GpsdWorkerPool
+
+SAMPLE = os.path.join(ROOT, 'sample_nmea', 'GPS_20121104_134730.log')
+WATCH = b'?WATCH={"enable":true,"json":true};\n'
+END = b'"device":"END"'
+
+def connect(port, unix, deadline):
+    while True:
+        try:
+            if unix:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(unix)
+            else:
+                sock = socket.create_connection(('127.0.0.1', port))
+            return sock
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def load(port, unix, count, offset, ready, results):
+    sel = selectors.DefaultSelector()
+    deadline = time.monotonic() + 10
+    for i in range(count):
+        sock = connect(port, unix if (offset + i) % 2 else None, deadline)
+        sock.sendall(WATCH)
+        sel.register(sock, selectors.EVENT_READ, [b'', 0])
+
+    # Wait for every WATCH to be acknowledged
+    waiting = count
+    while waiting:
+        for (key, _) in sel.select():
+            state = key.data
+            state[0] += key.fileobj.recv(65536)
+            if not state[1] and b'"class":"WATCH"' in state[0]:
+                state[1] = 1
+                state[0] = b''
+                waiting -= 1
+    ready.put(count)
+
+    received = 0
+    open_socks = count
+    while open_socks:
+        for (key, _) in sel.select():
+            data = key.fileobj.recv(65536)
+            received += len(data)
+
+            # Keep a tail around, in case END spans two reads
+            state = key.data
+            state[0] = state[0][-64:] + data
+            if END in state[0] or not data:
+                sel.unregister(key.fileobj)
+                key.fileobj.close()
+                open_socks -= 1
+
+    results.put((time.monotonic(), received))
+
+def run(workers, clients, epochs, loaders, port):
+    unix = os.path.join(tempfile.mkdtemp(), 'fixated.sock')
+    pool = GpsdWorkerPool(port=port, workers=workers, unix=unix)
+    pool.start()
+
+    ready = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    procs = []
+    per = clients // loaders
+    for idx in range(loaders):
+        count = per if idx < loaders - 1 else clients - per * (loaders - 1)
+        proc = multiprocessing.Process(target=load,
+                args=(port, unix, count, idx * per, ready, results))
+        proc.start()
+        procs.append(proc)
+
+    connected = sum(ready.get(timeout=60) for _ in procs)
+
+    tpvs = [tpv for (_, tpv) in zip(range(epochs), iter_tpvs(SAMPLE))]
+    start = time.monotonic()
+    for tpv in tpvs:
+        pool.publish('/dev/ttyBENCH', tpv)
+    pool.publish('END', tpvs[-1])
+
+    done = [results.get(timeout=300) for _ in procs]
+    elapsed = max(ts for (ts, _) in done) - start
+    received = sum(nbytes for (_, nbytes) in done)
+
+    for proc in procs:
+        proc.join()
+    pool.stop()
+    pool.join()
+    os.rmdir(os.path.dirname(unix))
+
+    return (connected, elapsed, received)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-c', '--clients', type=int, default=200)
+    parser.add_argument('-e', '--epochs', type=int, default=200)
+    parser.add_argument('-l', '--loaders', type=int, default=4,
+            help='Load generator processes (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('-p', '--port', type=int, default=29470)
+    args = parser.parse_args()
+
+    print('%d cores, %d clients, %d epochs' % (os.cpu_count(), args.clients, args.epochs))
+    for workers in args.workers:
+        (connected, elapsed, received) = run(workers, args.clients, args.epochs,
+                                             args.loaders, args.port)
+        reports = connected * (args.epochs + 1) * 2
+        print('%2d workers: %6.2f s, %9.0f reports/s, %6.1f MB/s' % (
+              workers, elapsed, reports / elapsed, received / elapsed / 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+Measures how long it takes to import fixated, using `python -X importtime`,
+and fails if it's over budget. Meant for CI, and for checking on the slow
+ARM boxes.
+
+Example:
+  $ python bench/importtime.py
+  $ python bench/importtime.py --runs 10 --scale 4
+'''
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# statement -> budget in ms (cumulative import time of the fixated modules)
+BUDGETS = [
+    ('import fixated', 5.0),
+    ('from fixated import iter_tpvs', 40.0),
+    ('import fixated.__main__', 40.0),
+]
+
+# Modules that must not be pulled in by a plain `import fixated`
+FORBIDDEN = ['pkg_resources', 'serial', 'ntpdshm', 'socket', 'threading']
+
+def importtime(stmt):
+    '''
+    Runs stmt in a fresh interpreter. Returns {module: cumulative us} for
+    every module imported, and the set of modules imported at the top level.
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', stmt],
+                          stderr=subprocess.PIPE, universal_newlines=True,
+                          env=env, check=True)
+
+    times = {}
+    top = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+
+        (_, cumulative, module) = line[len('import time:'):].split('|')
+        try:
+            times[module.strip()] = int(cumulative)
+        except ValueError:
+            continue # Header
+
+        # Nested imports are indented
+        if not module[1:].startswith(' '):
+            top.add(module.strip())
+
+    return (times, top)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-r', '--runs', type=int, default=5,
+            help='Take the best of this many runs (default: %(default)s)')
+    parser.add_argument('-s', '--scale', type=float, default=1.0,
+            help='Multiply the budgets, for slower machines (default: %(default)s)')
+    args = parser.parse_args()
+
+    failed = False
+    for (stmt, budget) in BUDGETS:
+        budget *= args.scale
+        best = None
+        for _ in range(args.runs):
+            (times, top) = importtime(stmt)
+            # Cumulative times already include everything imported under them
+            total = sum(times[mod] for mod in top
+                        if mod == 'fixated' or mod.startswith('fixated.'))
+            best = total if best is None else min(best, total)
+
+        ok = best / 1000.0 <= budget
+        failed |= not ok
+        print('%-40s %7.2f ms (budget %6.2f ms) %s' % (
+              stmt, best / 1000.0, budget, 'ok' if ok else 'OVER BUDGET'))
+
+    (loaded, _) = importtime('import fixated')
+    bad = [mod for mod in FORBIDDEN if mod in loaded]
+    if bad:
+        failed = True
+        print('import fixated pulled in: %s' % ', '.join(bad))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Measures parallel log parsing on a scaled-up copy of the sample log, against
+parsing it sequentially.
+
+Both parse_log() (TPVs) and parse_log_columns() (arrays) are timed at each
+worker count. The sequential baselines are iter_tpvs(), and iter_tpvs()
+followed by tpvs_to_columns().
+
+Example:
+  $ python bench/parallel_parse.py
+  $ python bench/parallel_parse.py --scale 100 --workers 1 8 16
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixated.file_parser import iter_tpvs
+from fixated.parallel_parser import parse_log, parse_log_columns, tpvs_to_columns
+
+SAMPLE = os.path.join(ROOT, 'sample_nmea', 'GPS_20121104_134730.log')
+
+def timed(func):
+    start = time.perf_counter()
+    count = func()
+    return (time.perf_counter() - start, count)
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-s', '--scale', type=int, default=20,
+            help='Copies of the sample log to concatenate (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+            default=sorted(set([1, 2, 4, cpus])),
+            help='Worker counts to try (default: %(default)s)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'sample_x%d.log' % args.scale)
+        with open(path, 'wb') as out:
+            for _ in range(args.scale):
+                with open(SAMPLE, 'rb') as fh:
+                    shutil.copyfileobj(fh, out)
+
+        print('%d cores, %dx sample log (%.1f MB)' % (
+              cpus, args.scale, os.path.getsize(path) / 1e6))
+
+        (seq, count) = timed(lambda: sum(1 for _ in iter_tpvs(path)))
+        (seq_cols, _) = timed(lambda: len(tpvs_to_columns(list(iter_tpvs(path)))['time']))
+        print('%-12s %8s %8s' % ('', 'TPVs', 'columns'))
+        print('%-12s %7.2fs %7.2fs  (%d epochs)' % ('sequential', seq, seq_cols, count))
+
+        for workers in args.workers:
+            (par, _) = timed(lambda: sum(1 for _ in parse_log(path, workers)))
+            (par_cols, _) = timed(lambda: len(parse_log_columns(path, workers)['time']))
+            print('%-12s %7.2fs %7.2fs  (speedup %.2fx / %.2fx)' % (
+                  '%d workers' % workers, par, par_cols, seq / par, seq_cols / par_cols))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
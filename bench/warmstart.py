@@ -0,0 +1,126 @@
+'''
+Measures time to first report after a restart, with and without a Snapshot.
+
+The sample log is replayed through an NmeaParser on a simulated receiver
+clock: a sentence carrying a new UTC time starts the next 1 s cycle, and the
+rest of the cycle follows 10 ms apart. A first run over the start of the log
+fills the snapshot, then the parser is "restarted" mid-stream at each of the
+given lines, and we report when the first TPV (last known or live) and the
+first live TPV come out.
+
+Example:
+  $ python bench/warmstart.py
+  $ python bench/warmstart.py --restart 100 500 1500
+'''
+import os
+import sys
+import queue
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixated.nmea import NmeaParser, NmeaError
+from fixated.snapshot import Snapshot
+from fixated.datatypes import TPV
+
+SAMPLE = os.path.join(ROOT, 'sample_nmea', 'GPS_20121104_134730.log')
+
+CYCLE = 1.0
+SPACING = 0.01
+
+class ReplayParser(NmeaParser):
+    '''
+    Replays sentences on a simulated clock, instead of the wall clock.
+    '''
+    USE_SHM = False
+
+    def __init__(self, tpv_queue, snapshot=None):
+        self.now = 0.0
+        self.last_utc = None
+        super().__init__(tpv_queue, 'replay', snapshot)
+
+    def clock(self, message):
+        return self.now
+
+    def feed(self, line):
+        fields = line.split(',')
+        utc = fields[1] if fields[0][3:] in ('RMC', 'GGA') and len(fields) > 1 else None
+        if utc and self.last_utc is None:
+            # The clock starts at the first sentence after the restart
+            self.last_utc = utc
+        elif utc and utc != self.last_utc:
+            self.now += CYCLE
+            self.last_utc = utc
+        else:
+            self.now += SPACING
+
+        try:
+            self.parse(line)
+        except NmeaError:
+            pass
+
+def replay(lines, snapshot=None):
+    '''
+    Returns (time of first TPV, time of first live TPV), in simulated
+    seconds since the start.
+    '''
+    tpvs = queue.Queue()
+    parser = ReplayParser(tpvs, snapshot)
+
+    first = first_live = None
+    for line in lines:
+        while not tpvs.empty():
+            (_, dat) = tpvs.get()
+            if not isinstance(dat, TPV):
+                continue
+            if first is None:
+                first = parser.now
+            if not dat.last_known:
+                first_live = parser.now
+
+        if first_live is not None:
+            break
+
+        parser.feed(line)
+
+    return (first, first_live)
+
+def fmt(val):
+    return '   n/a' if val is None else '%5.2fs' % val
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-r', '--restart', type=int, nargs='+', default=[311, 1000, 2001],
+            help='Lines of the sample log to restart at (default: %(default)s)')
+    parser.add_argument('-w', '--warmup', type=int, default=400,
+            help='Lines parsed before the restarts, to fill the snapshot (default: %(default)s)')
+    args = parser.parse_args()
+
+    with open(SAMPLE, encoding='ascii', errors='replace') as fh:
+        lines = [line.strip() for line in fh if line.strip()]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'warmstart.snap')
+        snap = Snapshot(path)
+        replay(lines[:args.warmup], snap)
+        snap.close()
+
+        print('%-12s %-22s %-22s' % ('', 'cold (first / live)', 'snapshot (first / live)'))
+        for start in args.restart:
+            cold = replay(lines[start:])
+
+            snap = Snapshot(path)
+            warm = replay(lines[start:], snap)
+            snap.close()
+
+            print('line %-7d %s / %s       %s / %s' % (
+                  start, fmt(cold[0]), fmt(cold[1]), fmt(warm[0]), fmt(warm[1])))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
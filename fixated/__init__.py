@@ -1,11 +1,47 @@
-from pkg_resources import get_distribution, DistributionNotFound
+import importlib
 
-from . import nmea
-from .datatypes import TPV
-from .serial_parser import SerialNmeaParser
-from .gpsd_sock import GpsdSocket
+# Subsystems are imported on first use, so `import fixated` stays cheap for
+# short CLI runs and for library use that only needs part of the package.
+_LAZY = {
+    'nmea': ('.nmea', None),
+    'TPV': ('.datatypes', 'TPV'),
+    'SerialNmeaParser': ('.serial_parser', 'SerialNmeaParser'),
+    'GpsdSocket': ('.gpsd_sock', 'GpsdSocket'),
+    'FileNmeaParser': ('.file_parser', 'FileNmeaParser'),
+    'iter_tpvs': ('.file_parser', 'iter_tpvs'),
+}
 
-try:
-    __version__ = get_distribution(__name__).version
-except DistributionNotFound:
-    __version__ = "unknown"
+__all__ = sorted(_LAZY) + ['__version__']
+
+def _get_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        from pkg_resources import get_distribution, DistributionNotFound
+        try:
+            return get_distribution(__name__).version
+        except DistributionNotFound:
+            return "unknown"
+
+    try:
+        return version(__name__)
+    except PackageNotFoundError:
+        return "unknown"
+
+def __getattr__(name):
+    if name == '__version__':
+        val = _get_version()
+    elif name in _LAZY:
+        (module, attr) = _LAZY[name]
+        val = importlib.import_module(module, __name__)
+        if attr:
+            val = getattr(val, attr)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    globals()[name] = val
+    return val
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,3 +1,4 @@
+import os
 import sys
 import logging
 import time
@@ -6,21 +7,102 @@ from collections import OrderedDict
 import fixated
 from fixated import TPV
 
+def export_main(argv):
+    import argparse
+    from fixated.file_parser import iter_tpvs
+    from fixated.export import export_track, WRITERS
+
+    parser = argparse.ArgumentParser(prog='fixated export',
+            description='Convert an NMEA log into a GPX or GeoJSON track')
+    parser.add_argument('log', help='NMEA log to read')
+    parser.add_argument('output', nargs='?', help='Track file to write (default: stdout)')
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS),
+            help='Output format (default: from the output extension, or gpx)')
+    parser.add_argument('-t', '--tolerance', type=float, default=5.0,
+            help='Simplification tolerance in meters, 0 to disable (default: %(default)s)')
+    parser.add_argument('-d', '--min-distance', type=float, default=0.0,
+            help='Drop points closer than this many meters (default: %(default)s)')
+    parser.add_argument('-g', '--max-gap', type=float, default=10.0,
+            help='Start a new segment after this many seconds without a fix (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.output or '')[1].lstrip('.').lower()
+        fmt = 'geojson' if ext in ('geojson', 'json') else 'gpx'
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # Before the output gets truncated
+    try:
+        open(args.log, 'rb').close()
+    except OSError as exc:
+        parser.error("can't read %s: %s" % (args.log, exc.strerror or exc))
+
+    try:
+        fh = open(args.output, 'w') if args.output else sys.stdout
+    except OSError as exc:
+        parser.error("can't write %s: %s" % (args.output, exc.strerror or exc))
+
+    name = os.path.basename(args.log)
+    try:
+        exp = export_track(iter_tpvs(args.log), fh, fmt, name=name,
+                           tolerance=args.tolerance,
+                           min_distance=args.min_distance,
+                           max_gap=args.max_gap)
+    except BaseException:
+        # Don't leave half a track behind
+        if fh is not sys.stdout:
+            fh.close()
+            os.unlink(args.output)
+        raise
+
+    if fh is not sys.stdout:
+        fh.close()
+
+    print('%d fixes -> %d points in %d segments' % (
+          exp.points_in, exp.points_out, exp.segments), file=sys.stderr)
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        export_main(sys.argv[2:])
+        return
+
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='fixated',
+            description='A simple GPS daemon (see also: fixated export -h)')
+    parser.add_argument('port', help='Serial port of the receiver')
+    parser.add_argument('baud', type=int, help='Baud rate')
+    parser.add_argument('snapshot', nargs='?',
+            help='Snapshot file, to serve the last fix right after a restart')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+            help='Serve clients from this many processes, sharing the port '
+                 'with SO_REUSEPORT (default: %(default)s, in-process)')
+    parser.add_argument('-u', '--unix', metavar='PATH',
+            help='Also listen on a Unix domain socket')
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.DEBUG)
 
-    try:
-        port = sys.argv[1]
-        baud = int(sys.argv[2])
-    except (IndexError, ValueError):
-        print('Usage: %s port baud' % sys.argv[0])
-        sys.exit(1)
+    port = args.port
+    baud = args.baud
+    snapshot_path = args.snapshot
 
-    st = fixated.GpsdSocket()
+    if args.workers > 1:
+        from fixated.gpsd_workers import GpsdWorkerPool
+        st = GpsdWorkerPool(workers=args.workers, unix=args.unix)
+    else:
+        st = fixated.GpsdSocket(unix=args.unix)
     st.start()
 
+    snapshot = None
+    if snapshot_path:
+        from fixated.snapshot import Snapshot
+        snapshot = Snapshot(snapshot_path)
+
     try:
-        np = fixated.SerialNmeaParser(st.tpv_queue, port, baud)
+        np = fixated.SerialNmeaParser(st.tpv_queue, port, baud, snapshot)
     except OSError as exc:
         print("Unable to open %s", port, file=sys.stderr)
         sys.exit(1)
@@ -33,14 +115,9 @@ def main():
                 print(sender)
                 print(dat)
 
-                for client in st.clients.values():
-                    if client.watch is True:
-                        client.send(dat.gpsd_tpv(sender.name))
-                        client.send(dat.gpsd_sky(sender.name))
+                st.publish(sender.name, dat)
             elif isinstance(dat, str):
-                for client in st.clients.values():
-                    if client.watch == 2:
-                        client.send(dat)
+                st.publish_raw(dat)
     except KeyboardInterrupt:
         pass
 
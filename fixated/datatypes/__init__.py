@@ -1,3 +1,3 @@
 from .tpv import TPV
 from .satellite import Satellite
-from .constants import FixDimension, FixQuality, FAAMode
+from .constants import FixDimension, FixQuality, FAAMode, GnssId
@@ -27,3 +27,25 @@ class FAAMode(enum.Enum):
     RTK_FLOAT    = 'F'
     PRECISE      = 'P'
 
+class GnssId(enum.IntEnum):
+    '''
+    Constellation IDs, as used by gpsd (and u-blox) in SKY reports.
+    '''
+    GPS     = 0
+    SBAS    = 1
+    GALILEO = 2
+    BEIDOU  = 3
+    IMES    = 4
+    QZSS    = 5
+    GLONASS = 6
+
+# gpsd's PRN for a satellite is its svid plus this
+GNSS_PRN_OFFSET = {
+    GnssId.GPS:     0,
+    GnssId.SBAS:    0,
+    GnssId.GALILEO: 300,
+    GnssId.BEIDOU:  200,
+    GnssId.IMES:    172,
+    GnssId.QZSS:    192,
+    GnssId.GLONASS: 64,
+}
@@ -1,19 +1,37 @@
+from .constants import GnssId, GNSS_PRN_OFFSET
+
 class Satellite:
-    __slots__ = ['nmea_id', 'elevation', 'azimuth', 'used', 'snr']
+    __slots__ = ['nmea_id', 'gnssid', 'svid', 'elevation', 'azimuth', 'used', 'snr']
 
-    def __init__(self, nmea_id, elevation=None, azimuth=None, snr=None):
+    def __init__(self, nmea_id, elevation=None, azimuth=None, snr=None,
+                 gnssid=GnssId.GPS, svid=None):
         self.nmea_id = nmea_id
+        self.gnssid = gnssid
+        self.svid = nmea_id if svid is None else svid
         self.elevation = elevation
         self.azimuth = azimuth
         self.snr = snr
         self.used = False
 
+    @property
+    def key(self):
+        return (self.gnssid, self.svid)
+
+    @property
+    def prn(self):
+        '''
+        The satellite's PRN, numbered the way gpsd does across constellations.
+        '''
+        return self.svid + GNSS_PRN_OFFSET[self.gnssid]
+
     def __str__(self):
         return self.__repr__()
 
     def __repr__(self):
-        return 'Satellite<nmea_id=%s, elevation=%s, azimuth=%s, snr=%s, used=%s>' % (
+        return 'Satellite<nmea_id=%s, gnssid=%s, svid=%s, elevation=%s, azimuth=%s, snr=%s, used=%s>' % (
                 self.nmea_id,
+                self.gnssid.name,
+                self.svid,
                 self.elevation,
                 self.azimuth,
                 self.snr,
@@ -23,7 +41,7 @@ class Satellite:
         if not isinstance(other, Satellite):
             return False
 
-        return self.nmea_id == other.nmea_id
+        return self.key == other.key
 
     def __hash__(self):
-        return self.nmea_id
+        return hash(self.key)
@@ -3,6 +3,7 @@ from datetime import datetime as dt
 from collections import OrderedDict
 
 from .satellite import Satellite
+from .constants import GnssId
 
 class TPV:
     def __init__(self):
@@ -34,13 +35,25 @@ class TPV:
 
         self.faa = None
 
+        # Restored from a snapshot, not freshly received
+        self.last_known = False
+
         self._ts = None
 
-    def get_satellite(self, nmea_id):
-        sat = self.satellites.get(nmea_id)
+    def get_satellite(self, nmea_id, gnssid=GnssId.GPS, svid=None):
+        '''
+        Returns the satellite for this epoch, creating it if needed.
+        Satellites are keyed by (gnssid, svid), so constellations that
+        reuse the same NMEA IDs don't overwrite each other.
+        '''
+        if svid is None:
+            svid = nmea_id
+
+        key = (gnssid, svid)
+        sat = self.satellites.get(key)
         if sat is None:
-            sat = Satellite(nmea_id)
-            self.satellites[nmea_id] = sat
+            sat = Satellite(nmea_id, gnssid=gnssid, svid=svid)
+            self.satellites[key] = sat
 
         return sat
 
@@ -48,7 +61,9 @@ class TPV:
         jsn = OrderedDict()
         jsn['class'] = 'TPV'
         jsn['device'] = name
-        jsn['mode'] = int(self.fix_dim.value)
+        jsn['mode'] = int(self.fix_dim.value) if self.fix_dim else 0
+        if self.last_known:
+            jsn['lastknown'] = True
         if self.dt:
             jsn['time'] = self.dt.isoformat() + 'Z'
         #jsn['ept'] = 0.1
@@ -94,7 +109,9 @@ class TPV:
         sats = []
         for sat in self.satellites.values():
             od = OrderedDict()
-            od['PRN'] = sat.nmea_id
+            od['PRN'] = sat.prn
+            od['gnssid'] = int(sat.gnssid)
+            od['svid'] = sat.svid
             od['el'] = sat.elevation
             od['az'] = sat.azimuth
             od['ss'] = sat.snr
@@ -0,0 +1,327 @@
+import math
+import json
+import shutil
+import tempfile
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+from .datatypes import FixDimension
+
+EARTH_RADIUS = 6371008.8 # Mean radius, meters
+
+TrackPoint = namedtuple('TrackPoint', ['lat', 'lon', 'alt', 'dt'])
+
+def _offset_m(origin, point):
+    '''
+    Returns (x, y) of point relative to origin, in meters, using a local
+    equirectangular projection. Plenty accurate over the few hundred meters
+    a simplification window spans.
+    '''
+    x = math.radians(point.lon - origin.lon) * math.cos(math.radians(origin.lat))
+    y = math.radians(point.lat - origin.lat)
+
+    return (x * EARTH_RADIUS, y * EARTH_RADIUS)
+
+def _segment_distance_m(start, end, point):
+    '''
+    Distance in meters from point to the line segment start -> end.
+    '''
+    (ex, ey) = _offset_m(start, end)
+    (px, py) = _offset_m(start, point)
+
+    seg_len2 = ex * ex + ey * ey
+    if seg_len2 == 0:
+        return math.hypot(px, py)
+
+    t = max(0.0, min(1.0, (px * ex + py * ey) / seg_len2))
+
+    return math.hypot(px - t * ex, py - t * ey)
+
+class TrackSimplifier:
+    '''
+    Online line simplification (opening window, a streaming Douglas-Peucker).
+
+    Points are buffered from the last kept point (the anchor) for as long as
+    every buffered point stays within `tolerance` meters of the line from the
+    anchor to the newest point. When that breaks, the point before the newest
+    one is kept and becomes the new anchor.
+
+    Parameters:
+      tolerance - Maximum deviation from the original track, meters
+      min_distance - Points closer than this to the last accepted point are
+                     dropped before simplification, meters
+      max_window - Upper bound on buffered points; keeps memory and the per
+                   point work bounded on long straight runs
+    '''
+    def __init__(self, tolerance=5.0, min_distance=0.0, max_window=64):
+        self.tolerance = tolerance
+        self.min_distance = min_distance
+        self.max_window = max_window
+
+        self.anchor = None
+        self.window = []
+
+    def add(self, point):
+        '''
+        Adds a point, returning the list of points that are now final.
+        '''
+        if self.anchor is None:
+            self.anchor = point
+            return [point]
+
+        last = self.window[-1] if self.window else self.anchor
+        if self.min_distance and \
+                math.hypot(*_offset_m(last, point)) < self.min_distance:
+            return []
+
+        if self.tolerance <= 0:
+            self.anchor = point
+            return [point]
+
+        for mid in self.window:
+            if _segment_distance_m(self.anchor, point, mid) > self.tolerance:
+                break
+        else:
+            self.window.append(point)
+            if len(self.window) < self.max_window:
+                return []
+
+            self.anchor = point
+            self.window = []
+            return [point]
+
+        kept = self.window[-1]
+        self.anchor = kept
+        self.window = [point]
+
+        return [kept]
+
+    def flush(self):
+        '''
+        Ends the current line, returning the points that haven't been
+        emitted yet.
+        '''
+        ret = self.window[-1:]
+        self.anchor = None
+        self.window = []
+
+        return ret
+
+class GpxWriter:
+    def __init__(self, fh, name=None):
+        self.fh = fh
+        self.name = name
+
+    def start(self):
+        self.fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<gpx version="1.1" creator="fixated" '
+                      'xmlns="http://www.topografix.com/GPX/1/1">\n'
+                      '<trk>\n')
+        if self.name:
+            self.fh.write('<name>%s</name>\n' % escape(self.name))
+
+    def start_segment(self):
+        self.fh.write('<trkseg>\n')
+
+    def point(self, pt, first):
+        out = '<trkpt lat="%.7f" lon="%.7f">' % (pt.lat, pt.lon)
+        if pt.alt is not None:
+            out += '<ele>%.1f</ele>' % pt.alt
+        if pt.dt is not None:
+            out += '<time>%sZ</time>' % pt.dt.isoformat()
+        out += '</trkpt>\n'
+
+        self.fh.write(out)
+
+    def end_segment(self):
+        self.fh.write('</trkseg>\n')
+
+    def end(self):
+        self.fh.write('</trk>\n</gpx>\n')
+
+class GeoJsonWriter:
+    '''
+    Writes a FeatureCollection, with one LineString Feature per segment.
+    Point times go in a parallel "times" property.
+
+    The properties come after the coordinates, so the times are spooled to
+    a temporary file while the segment is written, and copied over at the
+    end. That keeps memory flat, however long the segment.
+    '''
+    COPY_SIZE = 1 << 16
+
+    def __init__(self, fh, name=None):
+        self.fh = fh
+        self.name = name
+
+        self.features = 0
+        self.times = tempfile.TemporaryFile('w+')
+        self.n_times = 0
+
+    def start(self):
+        self.fh.write('{"type":"FeatureCollection","features":[')
+
+    def start_segment(self):
+        if self.features:
+            self.fh.write(',')
+        self.fh.write('\n{"type":"Feature","geometry":{"type":"LineString","coordinates":[')
+
+        self.features += 1
+        self.times.seek(0)
+        self.times.truncate()
+        self.n_times = 0
+
+    def point(self, pt, first):
+        coord = [round(pt.lon, 7), round(pt.lat, 7)]
+        if pt.alt is not None:
+            coord.append(pt.alt)
+
+        if not first:
+            self.fh.write(',')
+        self.fh.write(json.dumps(coord, separators=(',', ':')))
+
+        if self.n_times:
+            self.times.write(',')
+        self.times.write('null' if pt.dt is None else '"%sZ"' % pt.dt.isoformat())
+        self.n_times += 1
+
+    def end_segment(self):
+        self.fh.write(']},"properties":{')
+        if self.name:
+            self.fh.write('"name":%s,' % json.dumps(self.name))
+
+        self.fh.write('"times":[')
+        self.times.seek(0)
+        shutil.copyfileobj(self.times, self.fh, self.COPY_SIZE)
+        self.fh.write(']}}')
+
+        self.times.seek(0)
+        self.times.truncate()
+        self.n_times = 0
+
+    def end(self):
+        self.fh.write('\n]}\n')
+        self.times.close()
+
+WRITERS = {
+    'gpx': GpxWriter,
+    'geojson': GeoJsonWriter,
+}
+
+class TrackExporter:
+    '''
+    Turns a stream of TPVs into a GPX or GeoJSON track, writing as it goes.
+
+    The track is split into segments whenever the fix is lost, or when
+    consecutive fixes are more than `max_gap` seconds apart. Segments with
+    a single point are dropped.
+
+    Example:
+      > with open('track.gpx', 'w') as fh:
+      >     exp = TrackExporter(GpxWriter(fh), tolerance=5.0)
+      >     for tpv in iter_tpvs('capture.log'):
+      >         exp.add(tpv)
+      >     exp.close()
+    '''
+    def __init__(self, writer, tolerance=5.0, min_distance=0.0, max_gap=10.0,
+                 max_window=64):
+        self.writer = writer
+        self.simplifier = TrackSimplifier(tolerance, min_distance, max_window)
+        self.max_gap = max_gap
+
+        self.last_dt = None
+        self.pending = None # First point of a segment, until there's a second
+        self.seg_points = 0
+
+        self.points_in = 0
+        self.points_out = 0
+        self.segments = 0
+
+        self.writer.start()
+
+    @staticmethod
+    def has_fix(tpv):
+        if tpv.lat_dec is None or tpv.lon_dec is None:
+            return False
+        if tpv.warn:
+            return False
+        if tpv.fix_dim is FixDimension.NONE:
+            return False
+
+        return True
+
+    @staticmethod
+    def to_point(tpv):
+        try:
+            alt = float(tpv.alt)
+        except (ValueError, TypeError):
+            alt = None
+
+        return TrackPoint(tpv.lat_dec, tpv.lon_dec, alt, tpv.dt)
+
+    def add(self, tpv):
+        if not self.has_fix(tpv):
+            self.split()
+            return
+
+        if self.max_gap is not None and tpv.dt is not None and \
+                self.last_dt is not None:
+            gap = (tpv.dt - self.last_dt).total_seconds()
+            if gap < 0 or gap > self.max_gap:
+                self.split()
+        self.last_dt = tpv.dt
+
+        self.points_in += 1
+        for pt in self.simplifier.add(self.to_point(tpv)):
+            self._emit(pt)
+
+    def _emit(self, pt):
+        if self.seg_points == 0 and self.pending is None:
+            self.pending = pt
+            return
+
+        if self.pending is not None:
+            self.writer.start_segment()
+            self.writer.point(self.pending, True)
+            self.pending = None
+            self.seg_points = 1
+            self.segments += 1
+            self.points_out += 1
+
+        self.writer.point(pt, False)
+        self.seg_points += 1
+        self.points_out += 1
+
+    def split(self):
+        for pt in self.simplifier.flush():
+            self._emit(pt)
+
+        if self.seg_points:
+            self.writer.end_segment()
+
+        self.pending = None
+        self.seg_points = 0
+        self.last_dt = None
+
+    def close(self):
+        self.split()
+        self.writer.end()
+
+def export_track(tpvs, fh, fmt='gpx', name=None, **kwargs):
+    '''
+    Writes the TPVs from an iterable to fh as a track. Extra keyword
+    arguments are passed to TrackExporter.
+
+    Returns the exporter, for its point and segment counts.
+    '''
+    try:
+        writer = WRITERS[fmt](fh, name)
+    except KeyError:
+        raise ValueError("Unknown track format: %s" % fmt)
+
+    exp = TrackExporter(writer, **kwargs)
+    for tpv in tpvs:
+        exp.add(tpv)
+    exp.close()
+
+    return exp
@@ -0,0 +1,116 @@
+from collections import deque
+
+from .nmea import NmeaParser, NmeaError, ChecksumError
+from .datatypes import TPV
+
+# Sentences with a UTC hhmmss.sss time in the first field
+TIMED_SENTENCES = frozenset(['RMC', 'GGA', 'GBS', 'GST', 'ZDA'])
+
+class FileNmeaParser(NmeaParser):
+    '''
+    Parses a recorded NMEA log, for offline processing.
+
+    Unlike the serial parser, this never touches the ntpd SHM segment; the
+    clock in a recording has nothing to do with the clock on this machine.
+    '''
+    USE_SHM = False
+
+    def __init__(self, tpv_queue, path):
+        super().__init__(tpv_queue, path)
+        self.path = path
+
+        self.file_ts = None
+        self.day_offset = 0
+
+    def clock(self, message):
+        '''
+        A log doesn't record when each sentence arrived, so the wall clock
+        would make epoch detection depend on how fast we happen to parse.
+        Instead, time advances with the UTC stamps in the sentences, and by
+        a millisecond for each sentence without one. This keeps the parse
+        deterministic, and the first sentence of each epoch still sees the
+        longest gap, just like it would on a live receiver.
+        '''
+        stamp = None
+        if self.sentence_type(message[0]).msg_type in TIMED_SENTENCES and \
+                len(message) > 1:
+            _time = message[1]
+            try:
+                stamp = int(_time[0:2]) * 3600 + \
+                        int(_time[2:4]) * 60 + \
+                        float(_time[4:])
+            except ValueError:
+                stamp = None
+
+        if stamp is None:
+            self.file_ts = (self.file_ts or 0.0) + 0.001
+            return self.file_ts
+
+        # Midnight rollover
+        stamp += self.day_offset
+        if self.file_ts is not None and stamp < self.file_ts - 43200:
+            self.day_offset += 86400
+            stamp += 86400
+
+        self.file_ts = stamp
+        return stamp
+
+    def parse_lines(self, lines):
+        for line in lines:
+            if self.stopped.is_set():
+                break
+
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                if isinstance(line, bytes):
+                    line = line.decode('ascii')
+                self.parse(line)
+            except (UnicodeDecodeError, ChecksumError):
+                continue
+            except NmeaError as exc:
+                self.lgr.warn("Bad NMEA sentence: %s", line, exc_info=exc)
+            except Exception as exc:
+                self.lgr.error("Unhandled exception: %s", line, exc_info=exc)
+
+    def run(self):
+        with open(self.path, 'rb') as fh:
+            self.parse_lines(fh)
+
+        self.lgr.info("Finished %s", self.path)
+
+class _EpochSink:
+    '''
+    Stands in for the TPV queue, keeping only the completed epochs.
+    '''
+    __slots__ = ['epochs']
+
+    def __init__(self):
+        self.epochs = deque()
+
+    def put(self, item):
+        (_, dat) = item
+        if isinstance(dat, TPV):
+            self.epochs.append(dat)
+
+def iter_tpvs(path):
+    '''
+    Yields the TPVs in an NMEA log, one epoch at a time.
+
+    Only the epochs completed by the line currently being parsed are held
+    in memory, so this works on logs of any length.
+
+    Example:
+      > for tpv in iter_tpvs('sample_nmea/GPS_20121104_134730.log'):
+      >     print(tpv.coords)
+    '''
+    sink = _EpochSink()
+    parser = FileNmeaParser(sink, path)
+
+    with open(path, 'rb') as fh:
+        for line in fh:
+            parser.parse_lines((line,))
+            while sink.epochs:
+                yield sink.epochs.popleft()
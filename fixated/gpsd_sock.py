@@ -1,24 +1,69 @@
 import time
+import math
 import logging
 import socket
 import threading
 import select
+import os
 import json
 import queue
+from collections import namedtuple, OrderedDict
 
-#from fixated import __version__
+def encode_msg(msg):
+    return json.dumps(msg, separators=(',', ':')).encode() + b'\n'
 
-__version__ = '1.2.3'
+class Subscription(namedtuple('Subscription', ['interval', 'fields'])):
+    '''
+    What a watching client asked for: a minimum interval between reports
+    (in seconds, 0 for every epoch) and an optional set of report keys.
+
+    Clients with equal subscriptions share both their reporting schedule
+    and the serialized reports, so the encode work scales with the number
+    of distinct subscriptions, not with the number of clients.
+    '''
+    __slots__ = ()
+
+    # Always kept, regardless of the requested fields
+    BASE_FIELDS = ('class', 'device')
+
+    def project(self, msg):
+        if self.fields is None:
+            return msg
+
+        ret = OrderedDict((key, val) for (key, val) in msg.items()
+                          if key in self.BASE_FIELDS or key in self.fields)
+
+        # Nothing the client cares about, don't bother sending it
+        if len(ret) <= len(self.BASE_FIELDS):
+            return None
+
+        return ret
+
+    def encode(self, reports):
+        out = b''
+        for msg in reports:
+            msg = self.project(msg)
+            if msg is not None:
+                out += encode_msg(msg)
+
+        return out
+
+Subscription.ALL = Subscription(0.0, None)
 
 class GpsdClient:
     def __init__(self, sock):
         self.lgr = logging.getLogger(self.__class__.__name__)
         self.sock = sock
         self.watch = False
+        self.subscription = Subscription.ALL
+        self.new_watch = False
 
         self.buff = ''
         self.out_buff = b''
 
+        # Looked up here, not at import, since it means reading package metadata
+        from fixated import __version__
+
         msg = {
             'class': 'VERSION',
             'release': __version__,
@@ -31,15 +76,17 @@ class GpsdClient:
 
     def send(self, msg):
         if isinstance(msg, dict):
-            self.out_buff += json.dumps(msg, separators=(',', ':')).encode()
-            self.out_buff += b'\n'
+            self.out_buff += encode_msg(msg)
+        elif isinstance(msg, bytes):
+            # Already serialized and newline terminated
+            self.out_buff += msg
         else:
             self.out_buff += msg.encode()
             if msg[-1] != '\n':
                 self.out_buff += b'\n'
 
     def _send(self):
-        sent = self.sock.send(self.out_buff[0:1024])
+        sent = self.sock.send(self.out_buff[0:65536])
         self.out_buff = self.out_buff[sent:]
 
     @property
@@ -70,32 +117,201 @@ class GpsdClient:
             self.lgr.info(args)
             self.watch = False
             if args.get('enable') is True:
+                try:
+                    self.subscription = self.parse_subscription(args)
+                except (TypeError, ValueError) as exc:
+                    self.lgr.warn("Bad WATCH subscription: %s", args, exc_info=exc)
+                    self.send({'class': 'ERROR', 'message': 'Invalid WATCH rate or fields'})
+                    return
+
                 self.send('''{"class":"DEVICES","devices":[{"class":"DEVICE","path":"/dev/ttyS1","driver":"NMEA0183","activated":"2021-03-15T02:22:01.163Z","flags":1,"native":0,"bps":115200,"parity":"N","stopbits":1,"cycle":1.00}]}''')
                 self.send('''{"class":"WATCH","enable":true,"json":true,"nmea":false,"raw":0,"scaled":false,"timing":false,"split24":false,"pps":false}''')
                 self.watch = args.get('json') == True
-                self.lgr.info("self.watch=%s", self.watch)
+                self.new_watch = self.watch
+                self.lgr.info("self.watch=%s, subscription=%s", self.watch, self.subscription)
             elif args.get('raw') == 2:
                 self.send('''{"class":"DEVICES","devices":[{"class":"DEVICE","path":"/dev/ttyS1","driver":"NMEA0183","activated":"2021-03-15T02:22:01.163Z","flags":1,"native":0,"bps":115200,"parity":"N","stopbits":1,"cycle":1.00}]}''')
                 self.send('''{"class":"WATCH","enable":true,"json":true,"nmea":false,"raw":2,"scaled":false,"timing":false,"split24":false,"pps":true}''')
                 self.watch = 2
                 self.lgr.info("self.watch=%s", self.watch)
 
+    @staticmethod
+    def parse_subscription(args):
+        '''
+        Extensions to ?WATCH:
+          rate - Maximum reports per second (float, optional)
+          fields - List of report keys to send (optional)
+
+        Example:
+          ?WATCH={"enable":true,"json":true,"rate":1,"fields":["time","lat","lon"]}
+        '''
+        interval = 0.0
+        rate = args.get('rate')
+        if rate is not None:
+            rate = float(rate)
+            # NaN would compare false against everything, and pass as
+            # "every epoch"
+            if not math.isfinite(rate) or rate <= 0:
+                raise ValueError("rate must be positive and finite")
+            interval = 1.0 / rate
+
+        fields = args.get('fields')
+        if fields is not None:
+            if isinstance(fields, str) or \
+                    not all(isinstance(field, str) for field in fields):
+                raise TypeError("fields must be a list of strings")
+            fields = frozenset(fields)
+
+        return Subscription(interval, fields)
+
+def bind_unix(path):
+    '''
+    Binds a listening Unix domain socket at path, replacing a stale one.
+    '''
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    sock.setblocking(False)
+
+    return sock
+
+def bind_tcp(bind, port, reuse_port=False):
+    '''
+    Binds a listening TCP socket. With reuse_port, several of them (in as
+    many processes) can share the port.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((bind, port))
+        sock.listen()
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
 
 class GpsdSocket(threading.Thread):
-    def __init__(self, bind='127.0.0.1', port=2947):
+    '''
+    Serves gpsd clients over TCP, and optionally a Unix domain socket.
+
+    Parameters:
+      bind, port - TCP address to listen on
+      unix - Path for a Unix domain socket, or an already listening one
+      reuse_port - Set SO_REUSEPORT, so several processes can share the port
+      tcp - An already listening TCP socket, used instead of bind and port
+    '''
+    def __init__(self, bind='127.0.0.1', port=2947, unix=None, reuse_port=False,
+                 tcp=None):
         super().__init__()
 
         self.lgr = logging.getLogger(self.__class__.__name__)
         self.stopped = threading.Event()
         self.tpv_queue = queue.Queue()
 
-        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.lgr.info("Binding to %s:%s", bind, port)
-        self.srv.bind((bind, port))
+        if tcp is None:
+            self.lgr.info("Binding to %s:%s", bind, port)
+            tcp = bind_tcp(bind, port, reuse_port)
+        self.srv = tcp
+        self.listeners = [self.srv]
+
+        self.unix_path = None
+        if isinstance(unix, str):
+            self.lgr.info("Binding to %s", unix)
+            self.unix_path = unix
+            unix = bind_unix(unix)
+        if unix is not None:
+            self.listeners.append(unix)
+
+        # Other things to watch in the select loop: fileno-able -> callback
+        self.inputs = {}
 
         self.clients = {}
 
+        # (device, subscription) -> monotonic time the next report is due
+        self.report_due = {}
+
+        # device -> most recent TPV, for clients that start watching
+        self.latest = {}
+
+    def publish(self, device, tpv):
+        '''
+        Sends a TPV and SKY report for a completed epoch to all watching
+        clients, honoring their subscriptions.
+
+        Reports are scheduled on a fixed grid per (device, subscription):
+        the first epoch at or after the due time is sent, and the ones in
+        between are dropped. Each report is serialized once per distinct
+        subscription and the same bytes are queued for every client.
+        '''
+        self.latest[device] = tpv
+
+        groups = {}
+        for client in list(self.clients.values()):
+            if client.watch is True:
+                groups.setdefault(client.subscription, []).append(client)
+
+        # Forget schedules nobody is subscribed to anymore
+        for key in list(self.report_due):
+            if key[0] == device and key[1] not in groups:
+                del self.report_due[key]
+
+        now = time.monotonic()
+        reports = None
+        for (sub, clients) in groups.items():
+            if sub.interval:
+                key = (device, sub)
+                due = self.report_due.get(key)
+                if due is not None and now < due:
+                    continue
+
+                # Stay on the grid, unless we've fallen behind it
+                if due is None or now - due >= sub.interval:
+                    due = now
+                self.report_due[key] = due + sub.interval
+
+            if reports is None:
+                reports = (tpv.gpsd_tpv(device), tpv.gpsd_sky(device))
+
+            payload = sub.encode(reports)
+            if not payload:
+                continue
+
+            for client in clients:
+                client.send(payload)
+
+    def send_latest(self, client):
+        '''
+        Gives a client that just started watching the most recent fix from
+        each device (possibly a last known fix from a snapshot), rather than
+        having it wait for the next epoch.
+        '''
+        for (device, tpv) in list(self.latest.items()):
+            reports = (tpv.gpsd_tpv(device), tpv.gpsd_sky(device))
+            payload = client.subscription.encode(reports)
+            if payload:
+                client.send(payload)
+
+    def publish_raw(self, line):
+        '''
+        Passes a raw NMEA sentence through to clients watching with raw=2.
+        '''
+        payload = None
+        for client in list(self.clients.values()):
+            if client.watch == 2:
+                if payload is None:
+                    payload = line.encode()
+                    if not payload.endswith(b'\n'):
+                        payload += b'\n'
+                client.send(payload)
+
     def client_disconnect(self, sock, reason):
         self.lgr.info("Client disconnect: %s (%s)", sock, reason)
         try:
@@ -108,11 +324,10 @@ class GpsdSocket(threading.Thread):
         self.clients.pop(sock)
 
     def run(self):
-        self.srv.listen()
-
         while not self.stopped.is_set():
             rd_sox = list(self.clients.keys())
-            rd_sox.append(self.srv)
+            rd_sox.extend(self.listeners)
+            rd_sox.extend(self.inputs)
 
             wr_sox = [sock for (sock, client) in self.clients.items()
                       if client.has_data]
@@ -120,9 +335,16 @@ class GpsdSocket(threading.Thread):
             (rd_sox, wr_sox, _) = select.select(rd_sox, wr_sox, [], 0.10)
 
             for sox in rd_sox:
-                if sox is self.srv:
+                if sox in self.inputs:
+                    self.inputs[sox]()
+                    continue
+
+                if sox in self.listeners:
                     try:
-                        (client, _) = self.srv.accept()
+                        (client, _) = sox.accept()
+                    except BlockingIOError:
+                        # Another worker got it first
+                        continue
                     except OSError:
                         break
 
@@ -130,27 +352,52 @@ class GpsdSocket(threading.Thread):
                     self.clients[client] = GpsdClient(client)
                     continue
 
-                data = sox.recv(4096).decode()
+                if sox not in self.clients:
+                    continue
+
+                try:
+                    data = sox.recv(4096).decode()
+                except (OSError, UnicodeDecodeError) as exc:
+                    self.client_disconnect(sox, exc)
+                    continue
+
                 if len(data) == 0:
                     self.client_disconnect(sox, "Client closed socket")
                     continue
 
-                self.clients[client].feed(data)
+                client = self.clients[sox]
+                client.feed(data)
+                if client.new_watch:
+                    client.new_watch = False
+                    self.send_latest(client)
 
             for sox in wr_sox:
+                if sox not in self.clients:
+                    continue
+
                 try:
                     self.clients[sox]._send()
-                except socket.error:
-                    sox.close()
+                except socket.error as exc:
+                    self.client_disconnect(sox, exc)
 
         clients = list(self.clients.keys())
         for client in clients:
             self.client_disconnect(client, "Server shutting down")
 
     def stop(self):
-        if self.srv:
+        # A Unix socket passed in may be shared with other processes, only
+        # shut down the ones we made
+        owned = [self.srv]
+        if self.unix_path:
+            owned.append(self.listeners[1])
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+
+        for srv in owned:
             try:
-                self.srv.shutdown(socket.SHUT_RDWR)
+                srv.shutdown(socket.SHUT_RDWR)
             except:
                 pass
 
@@ -0,0 +1,208 @@
+import os
+import queue
+import pickle
+import logging
+import threading
+import multiprocessing
+
+from .gpsd_sock import GpsdSocket, bind_tcp, bind_unix
+
+def _worker_main(index, tcp, unix, conn):
+    '''
+    Runs a GpsdSocket in a worker process, on listening sockets from the
+    parent, taking epochs from the parent over conn.
+    '''
+    lgr = logging.getLogger('GpsdWorker-%d' % index)
+    srv = GpsdSocket(unix=unix, tcp=tcp)
+
+    def on_message():
+        try:
+            msg = pickle.loads(conn.recv_bytes())
+        except EOFError:
+            msg = None
+
+        if msg is None:
+            srv.stop()
+        elif msg[0] == 'tpv':
+            srv.publish(msg[1], msg[2])
+        elif msg[0] == 'raw':
+            srv.publish_raw(msg[1])
+
+    srv.inputs[conn] = on_message
+
+    lgr.info("Started, pid %d", os.getpid())
+    try:
+        srv.run()
+    except KeyboardInterrupt:
+        pass
+
+# Pickled stop message, sent last
+STOP = pickle.dumps(None, pickle.HIGHEST_PROTOCOL)
+
+class _WorkerPipe(threading.Thread):
+    '''
+    Writes messages to one worker's pipe from a thread of its own, so a
+    worker that's slow to read (busy with lots of clients) holds up only
+    its own messages, not the daemon's main loop.
+
+    Up to max_pending messages are queued for it. Past that, new messages
+    are dropped until it catches up.
+    '''
+    def __init__(self, index, proc, conn, max_pending):
+        super().__init__(name='GpsdWorkerPipe-%d' % index, daemon=True)
+
+        self.lgr = logging.getLogger(self.__class__.__name__)
+        self.index = index
+        self.proc = proc
+        self.conn = conn
+
+        self.pending = queue.Queue(max_pending)
+        self.dropped = 0
+        self.dead = False
+
+    def send(self, payload):
+        if self.dead:
+            return
+
+        try:
+            self.pending.put_nowait(payload)
+        except queue.Full:
+            if not self.dropped:
+                self.lgr.warning("Worker %d is falling behind, dropping messages",
+                                 self.index)
+            self.dropped += 1
+            return
+
+        if self.dropped:
+            self.lgr.warning("Worker %d caught up, %d messages dropped",
+                             self.index, self.dropped)
+            self.dropped = 0
+
+    def stop(self):
+        # Unlike the rest, this one has to get there
+        while not self.dead:
+            try:
+                self.pending.put(STOP, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def run(self):
+        while True:
+            payload = self.pending.get()
+            try:
+                self.conn.send_bytes(payload)
+            except OSError as exc:
+                self.lgr.error("Worker %d is gone (exit code %s), dropping it: %s",
+                               self.index, self.proc.exitcode, exc)
+                self.dead = True
+                return
+
+            if payload is STOP:
+                return
+
+class GpsdWorkerPool:
+    '''
+    Spreads gpsd clients over several processes, so serving them isn't
+    limited to one core.
+
+    Each worker gets its own TCP listener on the port, with SO_REUSEPORT,
+    and the kernel balances new connections across them. A Unix domain
+    socket, if asked for, is shared, with the workers racing to accept.
+    All of them are bound here, in start(), so a port that's taken is an
+    error there rather than in the workers.
+
+    A worker that dies is dropped, and the others carry on.
+
+    Each epoch is pickled once and written to one pipe per worker, which
+    then handles subscriptions and serialization for its own clients. The
+    writes happen on a thread per worker; if a worker falls more than
+    max_pending messages behind, it misses messages rather than stalling
+    the caller.
+
+    It's a drop-in for GpsdSocket in the daemon: put epochs on tpv_queue,
+    and hand them to publish() / publish_raw().
+
+    Example:
+      > pool = GpsdWorkerPool(workers=4, unix='/run/fixated.sock')
+      > pool.start()
+      > pool.publish('/dev/ttyUSB0', tpv)
+    '''
+    def __init__(self, bind='127.0.0.1', port=2947, workers=None, unix=None,
+                 max_pending=1024):
+        self.lgr = logging.getLogger(self.__class__.__name__)
+        self.tpv_queue = queue.Queue()
+
+        self.bind = bind
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+
+        self.unix_path = unix
+        self.unix = None
+
+        self.max_pending = max_pending
+        self.pipes = []
+
+    def start(self):
+        '''
+        Binds the sockets and starts the workers. Raises OSError if the
+        sockets can't be bound.
+        '''
+        self.lgr.info("Binding to %s:%s", self.bind, self.port)
+        try:
+            if self.unix_path:
+                self.lgr.info("Binding to %s", self.unix_path)
+                self.unix = bind_unix(self.unix_path)
+
+            for idx in range(self.workers):
+                # Bound one at a time, and closed here once the worker has
+                # it, so a forked worker doesn't hold on to the others' too
+                tcp = bind_tcp(self.bind, self.port, reuse_port=True)
+                try:
+                    (reader, writer) = multiprocessing.Pipe(duplex=False)
+                    proc = multiprocessing.Process(target=_worker_main,
+                            args=(idx, tcp, self.unix, reader),
+                            name='GpsdWorker-%d' % idx, daemon=True)
+                    proc.start()
+                    reader.close()
+                finally:
+                    tcp.close()
+
+                pipe = _WorkerPipe(idx, proc, writer, self.max_pending)
+                pipe.start()
+                self.pipes.append(pipe)
+        except:
+            self.stop()
+            self.join()
+            raise
+
+        self.lgr.info("Started %d workers on %s:%s", self.workers, self.bind, self.port)
+
+    def _broadcast(self, msg):
+        payload = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+        for pipe in self.pipes:
+            pipe.send(payload)
+
+    def publish(self, device, tpv):
+        self._broadcast(('tpv', device, tpv))
+
+    def publish_raw(self, line):
+        self._broadcast(('raw', line))
+
+    def stop(self):
+        for pipe in self.pipes:
+            pipe.stop()
+
+    def join(self):
+        for pipe in self.pipes:
+            pipe.join()
+            pipe.proc.join()
+            pipe.conn.close()
+        self.pipes = []
+
+        if self.unix:
+            self.unix.close()
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
@@ -1,15 +1,98 @@
 import time
 from datetime import datetime as dt
+from collections import namedtuple
+from functools import reduce
+from operator import xor
 import logging
 import threading
 
-try:
-    import ntpdshm
-except ImportError:
-    ntpdshm = None
-
 from .util import nmea_coord_to_dec_deg, ion, flon
-from .datatypes import TPV, FixDimension, FixQuality, FAAMode
+from .datatypes import TPV, FixDimension, FixQuality, FAAMode, GnssId
+from .datatypes.constants import GNSS_PRN_OFFSET
+
+# Talker ID -> constellation. GN (mixed) and anything unknown map to None,
+# and the satellites are sorted out by their NMEA IDs instead.
+TALKER_GNSS = {
+    'GP': GnssId.GPS,
+    'GL': GnssId.GLONASS,
+    'GA': GnssId.GALILEO,
+    'GB': GnssId.BEIDOU,
+    'BD': GnssId.BEIDOU,
+    'GQ': GnssId.QZSS,
+    'QZ': GnssId.QZSS,
+}
+
+# NMEA 4.11 system ID, the last field of GSA
+GSA_SYSTEM_ID = {
+    '1': GnssId.GPS,
+    '2': GnssId.GLONASS,
+    '3': GnssId.GALILEO,
+    '4': GnssId.BEIDOU,
+    '5': GnssId.QZSS,
+}
+
+# RMC sentences whose time is good enough to feed to ntpd
+NTP_RMC = frozenset(['$GPRMC', '$GNRMC'])
+
+Sentence = namedtuple('Sentence', ['msg_type', 'talker', 'handler'])
+
+def nmea_sat_id(talker, nmea_id):
+    '''
+    Works out which satellite an NMEA ID refers to.
+
+    Parameters:
+      talker - The constellation of the talker, or None if mixed / unknown
+      nmea_id - The satellite ID from the sentence
+
+    Returns (gnssid, svid)
+
+    Example:
+      > nmea_sat_id(None, 70)
+      (<GnssId.GLONASS: 6>, 6)
+    '''
+    if talker is None or talker is GnssId.GPS:
+        # Extended NMEA ranges, used by GN sentences and some GP ones
+        if nmea_id <= 32:
+            return (GnssId.GPS, nmea_id)
+        if nmea_id <= 64:
+            return (GnssId.SBAS, nmea_id + 87)
+        if nmea_id <= 96:
+            return (GnssId.GLONASS, nmea_id - 64)
+        if 120 <= nmea_id <= 158:
+            return (GnssId.SBAS, nmea_id)
+        if 193 <= nmea_id <= 200:
+            return (GnssId.QZSS, nmea_id - 192)
+        if 201 <= nmea_id <= 263:
+            return (GnssId.BEIDOU, nmea_id - 200)
+        if 301 <= nmea_id <= 336:
+            return (GnssId.GALILEO, nmea_id - 300)
+
+        return (GnssId.GPS, nmea_id)
+
+    # Some receivers number per constellation, others use the extended range
+    offset = GNSS_PRN_OFFSET[talker]
+    if offset and nmea_id > offset:
+        return (talker, nmea_id - offset)
+
+    return (talker, nmea_id)
+
+def open_shm(unit=0):
+    '''
+    Opens the ntpd shared memory segment, if the optional ntpdshm module is
+    installed. Returns None if it isn't, or if the segment can't be opened.
+
+    Imported here rather than at the top, so loading the parser doesn't
+    probe for it.
+    '''
+    try:
+        import ntpdshm
+    except ImportError:
+        return None
+
+    try:
+        return ntpdshm.NtpdShm(unit=unit)
+    except OSError:
+        return None
 
 class NmeaError(ValueError):
     pass
@@ -18,7 +101,14 @@ class ChecksumError(NmeaError):
     pass
 
 class NmeaParser(threading.Thread):
-    def __init__(self, tpv_queue, name):
+    # Give up on a lock resumed from a snapshot if its first sentence
+    # doesn't show up within this many sentences
+    RESUME_MAX_MISSES = 50
+
+    # Feed the time from RMC sentences to ntpd
+    USE_SHM = True
+
+    def __init__(self, tpv_queue, name, snapshot=None):
         super().__init__()
         self.lgr = logging.getLogger(self.__class__.__name__)
         self.stopped = threading.Event()
@@ -30,9 +120,13 @@ class NmeaParser(threading.Thread):
 
         self.last_cmd = None
         self.rmc_count = 0
+        self.resume_misses = None
 
         self.epx = self.epy = self.epv = None
 
+        # Constellation of the sentence being parsed
+        self.talker_gnss = None
+
         self.incoming_tpv = TPV()
         self.parsers = {
             'RMC': self.parse_rmc,
@@ -42,12 +136,33 @@ class NmeaParser(threading.Thread):
             'GBS': self.parse_gbs, # Occasional, preserve data
         }
 
-        self.shm = None
-        if ntpdshm:
-            try:
-                self.shm = ntpdshm.NtpdShm(unit=0)
-            except OSError:
-                self.shm = None
+        # Sentence name ('$GPGSV') -> Sentence, so the talker and type
+        # only get picked apart the first time a name is seen
+        self.sentences = {}
+
+        self.shm = open_shm(unit=0) if self.USE_SHM else None
+
+        self.snapshot = snapshot
+        if snapshot:
+            self.resume(snapshot.load())
+
+    def resume(self, state):
+        '''
+        Picks up where a previous run left off: queues the last known fix,
+        and restores the epoch lock, so the next epoch goes out as soon as
+        it's complete instead of after relearning the sentence cycle.
+        '''
+        if state is None:
+            return
+
+        (tpv, last_cmd, rmc_count) = state
+        self.lgr.info("Resuming from snapshot: last_cmd=%s, %s", last_cmd, tpv)
+        self.tpv_queue.put((self, tpv))
+
+        if last_cmd:
+            self.last_cmd = last_cmd
+            self.rmc_count = rmc_count
+            self.resume_misses = 0
 
     def stop(self):
         self.stopped.set()
@@ -55,6 +170,28 @@ class NmeaParser(threading.Thread):
     def run(self):
         raise NotImplementedError()
 
+    def clock(self, message):
+        '''
+        Arrival time of a sentence, used to learn which sentence starts
+        an epoch. Live parsers use the wall clock.
+        '''
+        return time.monotonic()
+
+    def sentence_type(self, name):
+        sentence = self.sentences.get(name)
+        if sentence is not None:
+            return sentence
+
+        msg_type = name[3:]
+        sentence = Sentence(msg_type, TALKER_GNSS.get(name[1:3]),
+                            self.parsers.get(msg_type))
+
+        # Only cache well formed names, so junk can't grow the table
+        if len(name) == 6 and name[0] == '$':
+            self.sentences[name] = sentence
+
+        return sentence
+
     def parse(self, line):
         '''
         Assumptions:
@@ -69,9 +206,7 @@ class NmeaParser(threading.Thread):
         
         # Calculate the checksum (characters after $ sign)
         # Dump if the line doesn't match
-        calced_csum = 0
-        for char in map(ord, message[1:]):
-            calced_csum ^= char
+        calced_csum = reduce(xor, message.encode()[1:], 0)
         if calced_csum != reported_csum:
             raise ChecksumError()
 
@@ -79,18 +214,19 @@ class NmeaParser(threading.Thread):
 
         message = message.split(',')
         name = message[0]
-        msg_type = name[3:]
-        if msg_type not in self.parsers:
+        sentence = self.sentence_type(name)
+        if sentence.handler is None:
             return False
 
-        ts = time.monotonic()
+        ts = self.clock(message)
         if self.last_msg_ts:
             self.msg_tdel[name] = (ts - self.last_msg_ts)
         self.last_msg_ts = ts
 
         # Find appropriate parsing function (if it exists)
         try:
-            self.parsers[msg_type](message)
+            self.talker_gnss = sentence.talker
+            sentence.handler(message)
             ret = True
         except Exception as exc:
             raise NmeaError("Error parsing %s" % name) from exc
@@ -106,10 +242,10 @@ class NmeaParser(threading.Thread):
         '''
         found_it = False
 
-        if len(self.msg_tdel) < 2:
-            return
-
         if not self.last_cmd:
+            if len(self.msg_tdel) < 2:
+                return
+
             longest_msg = max(self.msg_tdel, key=self.msg_tdel.get)
             self.lgr.debug("Longest message: %s (%s)", longest_msg, self.msg_tdel[longest_msg])
 
@@ -122,12 +258,29 @@ class NmeaParser(threading.Thread):
         else:
             found_it = (cmd == self.last_cmd)
 
+        # The first epoch after resuming holds whatever came in before the
+        # lock sentence, so it's not worth keeping in the snapshot
+        partial = False
+        if self.resume_misses is not None:
+            if found_it:
+                self.resume_misses = None
+                partial = True
+            else:
+                self.resume_misses += 1
+                if self.resume_misses > self.RESUME_MAX_MISSES:
+                    self.lgr.warn("Resumed msg_lock on %s never came, relearning", self.last_cmd)
+                    self.last_cmd = None
+                    self.rmc_count = 0
+                    self.resume_misses = None
+
         if found_it:
             #self.lgr.info(self.incoming_tpv)
             self.incoming_tpv.epx = self.epx
             self.incoming_tpv.epy = self.epy
             self.incoming_tpv.epv = self.epv
             self.tpv_queue.put((self, self.incoming_tpv))
+            if self.snapshot and not partial:
+                self.snapshot.save(self.incoming_tpv, self.last_cmd, self.rmc_count)
             self.incoming_tpv = TPV()
 
     def parse_rmc(self, message):
@@ -181,7 +334,7 @@ class NmeaParser(threading.Thread):
             return
 
         inc.dt = dt(year, month, day, hour, minute, second)
-        if not inc.warn and self.shm and cmd == '$GPRMC':
+        if not inc.warn and self.shm and cmd in NTP_RMC:
             self.shm.update(inc.unix_ts, precision=-2)
 
         self.rmc_count += 1
@@ -220,6 +373,11 @@ class NmeaParser(threading.Thread):
 
         cmd = message[0]
 
+        # GN sentences may say which constellation they're about
+        talker = self.talker_gnss
+        if talker is None and len(message) > 18:
+            talker = GSA_SYSTEM_ID.get(message[18])
+
         inc.forced = (message[1] == 'M')
         try:
             inc.fix_dim = FixDimension(message[2])
@@ -234,26 +392,31 @@ class NmeaParser(threading.Thread):
             except ValueError:
                 raise NmeaError("GSA: Invalid satellite PRN")
 
-            sat = inc.get_satellite(nmea_id)
+            (gnssid, svid) = nmea_sat_id(talker, nmea_id)
+            sat = inc.get_satellite(nmea_id, gnssid, svid)
             sat.used = True
 
         (inc.pdop, inc.hdop, inc.vdop) = message[15:18]
 
     def parse_gsv(self, message):
         # Assumptions:
-        # - No duplicate nmea_id's
+        # - No duplicate nmea_id's within a constellation
+        talker = self.talker_gnss
         message = list(map(ion, message[1:]))
         #(num_msgs, msg_idx, sat_count) = message[0:3]
 
-        # Grab satellites in blocks of four
-        for i in range(3, len(message), 4):
+        # Grab satellites in blocks of four. NMEA 4.10 adds a signal ID
+        # after the last block, skip it.
+        end = len(message) - (len(message) - 3) % 4
+        for i in range(3, end, 4):
             (nmea_id, elevation, azimuth, snr) = message[i:i+4]
             if nmea_id is None or \
                 elevation is None or \
                 azimuth is None:
                 return
 
-            sat = self.incoming_tpv.get_satellite(nmea_id)
+            (gnssid, svid) = nmea_sat_id(talker, nmea_id)
+            sat = self.incoming_tpv.get_satellite(nmea_id, gnssid, svid)
             sat.elevation = elevation
             sat.azimuth = azimuth
             sat.snr = snr
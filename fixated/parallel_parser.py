@@ -0,0 +1,272 @@
+import os
+import mmap
+import math
+import calendar
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .file_parser import FileNmeaParser, _EpochSink
+
+# Don't bother splitting work finer than this
+MIN_CHUNK_SIZE = 1 << 20
+
+# Nor coarser, so a chunk's results stay a modest amount of memory
+MAX_CHUNK_SIZE = 64 << 20
+
+# Chunks submitted to the pool ahead of the one being consumed, per worker
+IN_FLIGHT_PER_WORKER = 2
+
+# Float columns, and the TPV attribute each one comes from
+FLOAT_COLUMNS = [
+    ('lat', 'lat_dec'),
+    ('lon', 'lon_dec'),
+    ('alt', 'alt'),
+    ('height_wgs84', 'height_wgs84'),
+    ('speed', 'vel_knots'),
+    ('track', 'vel_deg'),
+    ('hdop', 'hdop'),
+    ('vdop', 'vdop'),
+    ('pdop', 'pdop'),
+    ('epx', 'epx'),
+    ('epy', 'epy'),
+    ('epv', 'epv'),
+]
+
+class ChunkNmeaParser(FileNmeaParser):
+    '''
+    A FileNmeaParser that remembers whether it has seen a GBS sentence.
+
+    GBS values stick around until the next GBS, so epochs at the start of a
+    chunk may need them patched in from the chunk before.
+    '''
+    def __init__(self, tpv_queue, path):
+        super().__init__(tpv_queue, path)
+        self.gbs_seen = False
+
+    def parse_gbs(self, message):
+        super().parse_gbs(message)
+        self.gbs_seen = True
+
+def _lines(mm, pos, size):
+    while pos < size:
+        nl = mm.find(b'\n', pos)
+        line_end = size if nl < 0 else nl + 1
+        yield (pos, mm[pos:line_end])
+        pos = line_end
+
+def _find_lock(path, mm, size):
+    '''
+    Parses from the start of the log until the parser has learned which
+    sentence starts an epoch.
+
+    Returns (offset after the lock sentence, lock state), or (None, None) if
+    the log never locks.
+    '''
+    sink = _EpochSink()
+    parser = FileNmeaParser(sink, path)
+
+    for (off, line) in _lines(mm, 0, size):
+        parser.parse_lines((line,))
+        if parser.last_cmd:
+            state = {
+                'last_cmd': parser.last_cmd,
+                'msg_tdel': dict(parser.msg_tdel),
+                'rmc_count': parser.rmc_count,
+            }
+            return (off + len(line), state)
+
+    return (None, None)
+
+def _to_float(val):
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return math.nan
+
+def tpvs_to_columns(tpvs):
+    '''
+    Converts a list of TPVs to a dict of arrays. Missing values are NaN in
+    the float columns, and 0 in 'mode'. 'time' is seconds since the epoch.
+    '''
+    cols = {name: array('d') for (name, _) in FLOAT_COLUMNS}
+    cols['time'] = array('d')
+    cols['mode'] = array('b')
+
+    for tpv in tpvs:
+        for (name, attr) in FLOAT_COLUMNS:
+            cols[name].append(_to_float(getattr(tpv, attr)))
+
+        if tpv.dt is None:
+            cols['time'].append(math.nan)
+        else:
+            cols['time'].append(calendar.timegm(tpv.dt.utctimetuple()))
+
+        cols['mode'].append(0 if tpv.fix_dim is None else int(tpv.fix_dim.value))
+
+    return cols
+
+def _parse_chunk(path, index, start, end, lock_state, columns):
+    '''
+    Parses the epochs belonging to the chunk [start, end) of the log.
+
+    An epoch belongs to the chunk holding the sentence that completes it.
+    The first epoch completed in a chunk also has sentences from the chunk
+    before, so it's thrown away here. The chunk before parses past its end to
+    complete that epoch instead.
+    '''
+    sink = _EpochSink()
+    parser = ChunkNmeaParser(sink, path)
+    if lock_state:
+        parser.last_cmd = lock_state['last_cmd']
+        parser.msg_tdel = dict(lock_state['msg_tdel'])
+        parser.rmc_count = lock_state['rmc_count']
+
+    tpvs = []
+    no_gbs = 0
+    gbs_at_end = None
+    started = (index == 0)
+
+    with open(path, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for (off, line) in _lines(mm, start, size):
+                if off >= end and gbs_at_end is None:
+                    gbs_at_end = (parser.gbs_seen, parser.epx, parser.epy, parser.epv)
+
+                parser.parse_lines((line,))
+                if not sink.epochs:
+                    continue
+
+                while sink.epochs:
+                    tpv = sink.epochs.popleft()
+                    if not started:
+                        started = True
+                        continue
+
+                    tpvs.append(tpv)
+                    if not parser.gbs_seen:
+                        no_gbs += 1
+
+                if off >= end:
+                    break
+
+    if gbs_at_end is None:
+        gbs_at_end = (parser.gbs_seen, parser.epx, parser.epy, parser.epv)
+
+    if columns:
+        tpvs = tpvs_to_columns(tpvs)
+
+    return (tpvs, no_gbs, gbs_at_end)
+
+def _split(mm, size, start, count):
+    '''
+    Splits [start, size) into roughly equal chunks on line boundaries.
+    '''
+    bounds = [start]
+    for i in range(1, count):
+        pos = start + (size - start) * i // count
+        nl = mm.find(b'\n', pos)
+        pos = size if nl < 0 else nl + 1
+        if pos > bounds[-1] and pos < size:
+            bounds.append(pos)
+    bounds.append(size)
+
+    return bounds
+
+def _chunk_jobs(path, workers):
+    with open(path, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size == 0:
+            return []
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            (lock_end, lock_state) = _find_lock(path, mm, size)
+            if lock_end is None:
+                return []
+
+            remaining = size - lock_end
+            count = max(1, min(workers * 4, remaining // MIN_CHUNK_SIZE),
+                        -(-remaining // MAX_CHUNK_SIZE))
+            bounds = _split(mm, size, lock_end, count)
+
+    # The first chunk starts from scratch, and learns the lock on its own
+    bounds[0] = 0
+    return [(idx, bounds[idx], bounds[idx + 1], lock_state if idx else None)
+            for idx in range(len(bounds) - 1)]
+
+def _stitched(path, workers, columns):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    jobs = _chunk_jobs(path, workers)
+    if not jobs:
+        return
+
+    gbs = (None, None, None)
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Only keep a few chunks in flight, so results don't pile up in the
+        # parent faster than they're consumed
+        futures = deque()
+
+        def submit():
+            job = next(jobs, None)
+            if job is not None:
+                futures.append(pool.submit(_parse_chunk, path, *job, columns))
+
+        for _ in range(workers * IN_FLIGHT_PER_WORKER):
+            submit()
+
+        idx = 0
+        while futures:
+            (tpvs, no_gbs, (gbs_seen, epx, epy, epv)) = futures.popleft().result()
+            submit()
+
+            # Carry the GBS values over from the chunks before
+            if idx and no_gbs:
+                if columns:
+                    for (name, val) in zip(('epx', 'epy', 'epv'), gbs):
+                        col = tpvs[name]
+                        for i in range(no_gbs):
+                            col[i] = _to_float(val)
+                else:
+                    for tpv in tpvs[:no_gbs]:
+                        (tpv.epx, tpv.epy, tpv.epv) = gbs
+
+            if gbs_seen or idx == 0:
+                gbs = (epx, epy, epv)
+
+            yield tpvs
+            idx += 1
+
+def parse_log(path, workers=None):
+    '''
+    Parses an NMEA log across several processes, yielding TPVs in the same
+    order, and with the same contents, as iter_tpvs().
+
+    This is no faster than iter_tpvs(), however many workers there are, and
+    usually slower: every TPV gets pickled in a worker and rebuilt here, in
+    the parent, and that alone costs about as much as parsing it. For bulk
+    work, use parse_log_columns(), which does scale with the workers (see
+    bench/parallel_parse.py).
+
+    Parameters:
+      path - The log to parse
+      workers - Number of processes (default: one per CPU)
+    '''
+    for tpvs in _stitched(path, workers, False):
+        yield from tpvs
+
+def parse_log_columns(path, workers=None):
+    '''
+    Like parse_log(), but returns the epochs as a dict of arrays (see
+    tpvs_to_columns). Arrays are cheap to ship back from the workers, so
+    unlike parse_log(), this gets faster with more of them.
+    '''
+    ret = tpvs_to_columns([])
+    for cols in _stitched(path, workers, True):
+        for (name, col) in cols.items():
+            ret[name].extend(col)
+
+    return ret
@@ -5,8 +5,8 @@ import serial
 from .nmea import NmeaParser, NmeaError, ChecksumError
 
 class SerialNmeaParser(NmeaParser):
-    def __init__(self, tpv_queue, tty, baud=9600):
-        super().__init__(tpv_queue, tty)
+    def __init__(self, tpv_queue, tty, baud=9600, snapshot=None):
+        super().__init__(tpv_queue, tty, snapshot)
 
         self.baud = baud
         self.buff = b''
@@ -38,6 +38,8 @@ class SerialNmeaParser(NmeaParser):
             self.buff = lines[-1]
 
         self.lgr.info("Shutting down")
+        if self.snapshot:
+            self.snapshot.close()
 
     def stop(self):
         super().stop()
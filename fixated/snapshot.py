@@ -0,0 +1,132 @@
+import os
+import mmap
+import math
+import struct
+import zlib
+import logging
+import calendar
+from datetime import datetime as dt, timedelta
+
+from .datatypes import TPV, FixDimension, FixQuality, FAAMode
+
+MAGIC = b'FXSN'
+VERSION = 1
+
+# magic, version, rmc_count, last_cmd,
+# unix_ts, lat, lon, alt, height_wgs84, speed, track,
+# hdop, vdop, pdop, epx, epy, epv, mag_dev,
+# fix_dim, fix_quality, faa
+RECORD = struct.Struct('<4sHI16s14d1s1s1s')
+CRC = struct.Struct('<I')
+SIZE = RECORD.size + CRC.size
+
+# TPV.dt is naive UTC
+UNIX_EPOCH = dt(1970, 1, 1)
+
+FLOAT_ATTRS = ['alt', 'height_wgs84', 'vel_knots', 'vel_deg',
+               'hdop', 'vdop', 'pdop', 'epx', 'epy', 'epv', 'mag_dev']
+
+def _f(val):
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return math.nan
+
+def _unf(val):
+    return None if math.isnan(val) else val
+
+def _enum_val(val):
+    return b'\0' if val is None else val.value.encode()
+
+def _enum(cls, val):
+    try:
+        return cls(val.decode())
+    except ValueError:
+        return None
+
+class Snapshot:
+    '''
+    A small memory mapped file holding the last good epoch from a device,
+    and the parser's epoch lock.
+
+    Saving is a struct.pack_into() into the map, cheap enough to do every
+    epoch. The kernel writes it back on its own schedule, which is enough
+    to survive the daemon restarting. A CRC guards against reading a torn
+    or stale-format record.
+
+    Example:
+      > snap = Snapshot('/var/lib/fixated/ttyUSB0.snap')
+      > parser = SerialNmeaParser(queue, '/dev/ttyUSB0', 9600, snapshot=snap)
+    '''
+    def __init__(self, path):
+        self.lgr = logging.getLogger(self.__class__.__name__)
+        self.path = path
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < SIZE:
+                os.ftruncate(fd, SIZE)
+            self.mm = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+
+    def save(self, tpv, last_cmd, rmc_count):
+        '''
+        Records tpv, if it has a usable fix.
+        '''
+        if tpv.lat_dec is None or tpv.lon_dec is None or tpv.warn:
+            return False
+
+        if tpv.dt is None:
+            unix_ts = math.nan
+        else:
+            unix_ts = calendar.timegm(tpv.dt.utctimetuple())
+
+        RECORD.pack_into(self.mm, 0,
+            MAGIC, VERSION, rmc_count, (last_cmd or '').encode()[:16],
+            unix_ts, tpv.lat_dec, tpv.lon_dec,
+            *[_f(getattr(tpv, attr)) for attr in FLOAT_ATTRS],
+            _enum_val(tpv.fix_dim), _enum_val(tpv.fix_quality), _enum_val(tpv.faa))
+        CRC.pack_into(self.mm, RECORD.size, zlib.crc32(self.mm[:RECORD.size]))
+
+        return True
+
+    def load(self):
+        '''
+        Returns (tpv, last_cmd, rmc_count) from the snapshot, or None if it's
+        empty or invalid. The TPV is flagged as last_known.
+        '''
+        data = self.mm[:RECORD.size]
+        (crc,) = CRC.unpack_from(self.mm, RECORD.size)
+        if crc != zlib.crc32(data):
+            return None
+
+        fields = RECORD.unpack(data)
+        (magic, version, rmc_count, last_cmd, unix_ts, lat, lon) = fields[:7]
+        if magic != MAGIC or version != VERSION:
+            return None
+
+        tpv = TPV()
+        tpv.last_known = True
+        tpv.lat_dec = lat
+        tpv.lon_dec = lon
+        for (attr, val) in zip(FLOAT_ATTRS, fields[7:7 + len(FLOAT_ATTRS)]):
+            setattr(tpv, attr, _unf(val))
+
+        if not math.isnan(unix_ts):
+            tpv.dt = UNIX_EPOCH + timedelta(seconds=unix_ts)
+
+        (fix_dim, fix_quality, faa) = fields[-3:]
+        tpv.fix_dim = _enum(FixDimension, fix_dim) or FixDimension.NONE
+        tpv.fix_quality = _enum(FixQuality, fix_quality)
+        tpv.faa = _enum(FAAMode, faa)
+        tpv.warn = False
+
+        last_cmd = last_cmd.rstrip(b'\0').decode('ascii', 'replace') or None
+
+        return (tpv, last_cmd, rmc_count)
+
+    def close(self):
+        if self.mm:
+            self.mm.close()
+            self.mm = None
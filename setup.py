@@ -5,7 +5,7 @@ with open("README.md", "r", encoding="utf-8") as fh:
 
 setup(
     name="fixated",
-    python_requires=">=3.5",
+    python_requires=">=3.7",
     use_scm_version=True,
     author="Tim K",
     author_email="tpkuester@gmail.com",
@@ -19,7 +19,7 @@ setup(
     classifiers=[
         "Topic :: Communications",
         "Development Status :: 3 - Alpha",
-        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3.7",
         "License :: OSI Approved :: MIT License",
     ],
     entry_points={
@@ -0,0 +1,188 @@
+import json
+from datetime import datetime as dt
+
+import pytest
+
+from fixated import gpsd_sock
+from fixated.gpsd_sock import GpsdClient, GpsdSocket, Subscription
+from fixated.datatypes import TPV, FixDimension
+
+class FakeSocket:
+    '''
+    Stands in for a client or listening socket. Nothing is ever sent, the
+    tests read what's queued in the client's out_buff instead.
+    '''
+    def fileno(self):
+        return -1
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gpsd_sock.time, 'monotonic', clock)
+    return clock
+
+@pytest.fixture
+def srv():
+    return GpsdSocket(tcp=FakeSocket())
+
+def make_tpv():
+    tpv = TPV()
+    tpv.dt = dt(2012, 11, 4, 13, 47, 30)
+    tpv.lat_dec = 55.672
+    tpv.lon_dec = 12.521
+    tpv.alt = '36.1'
+    tpv.fix_dim = FixDimension.THREE_D
+    tpv.hdop = '0.8'
+    sat = tpv.get_satellite(5)
+    (sat.elevation, sat.azimuth, sat.snr, sat.used) = (45, 100, 40, True)
+
+    return tpv
+
+def reports(client):
+    '''
+    Returns and clears what's been queued for a client, as a list of dicts.
+    '''
+    out = client.out_buff
+    client.out_buff = b''
+
+    return [json.loads(line) for line in out.decode().splitlines()]
+
+def watch(srv, args):
+    sock = FakeSocket()
+    client = GpsdClient(sock)
+    srv.clients[sock] = client
+
+    client.feed('?WATCH=%s;\n' % args)
+    reports(client)
+
+    return client
+
+@pytest.mark.parametrize('args, expected', [
+    ({}, Subscription.ALL),
+    ({'rate': 2}, Subscription(0.5, None)),
+    ({'rate': '0.5'}, Subscription(2.0, None)),
+    ({'fields': ['lat', 'lon']}, Subscription(0.0, frozenset(['lat', 'lon']))),
+    ({'rate': 1, 'fields': []}, Subscription(1.0, frozenset())),
+])
+def test_parse_subscription(args, expected):
+    assert GpsdClient.parse_subscription(args) == expected
+
+@pytest.mark.parametrize('extra', [
+    '"rate":0',
+    '"rate":-1',
+    '"rate":NaN',
+    '"rate":Infinity',
+    '"rate":"nan"',
+    '"rate":"inf"',
+    '"rate":"fast"',
+    '"rate":[1]',
+    '"fields":"lat"',
+    '"fields":["lat",1]',
+    '"fields":3',
+])
+def test_watch_rejects_bad_subscription(extra):
+    client = GpsdClient(FakeSocket())
+    reports(client)
+
+    client.feed('?WATCH={"enable":true,"json":true,%s};\n' % extra)
+
+    assert reports(client) == [
+        {'class': 'ERROR', 'message': 'Invalid WATCH rate or fields'}]
+    assert client.watch is False
+
+def test_watch_accepts_subscription():
+    client = GpsdClient(FakeSocket())
+    reports(client)
+
+    client.feed('?WATCH={"enable":true,"json":true,"rate":1,"fields":["lat"]};\n')
+
+    assert [msg['class'] for msg in reports(client)] == ['DEVICES', 'WATCH']
+    assert client.watch is True
+    assert client.subscription == Subscription(1.0, frozenset(['lat']))
+
+def test_publish_everything(srv, clock):
+    client = watch(srv, '{"enable":true,"json":true}')
+    srv.publish('/dev/gps0', make_tpv())
+
+    (tpv, sky) = reports(client)
+    assert (tpv['class'], tpv['device'], tpv['mode']) == ('TPV', '/dev/gps0', 3)
+    assert (tpv['lat'], tpv['lon'], tpv['alt']) == (55.672, 12.521, 36.1)
+    assert sky['class'] == 'SKY'
+    assert [sat['PRN'] for sat in sky['satellites']] == [5]
+
+def test_publish_projection(srv, clock):
+    client = watch(srv, '{"enable":true,"json":true,"fields":["lat","lon"]}')
+    srv.publish('/dev/gps0', make_tpv())
+
+    # The SKY report has neither, so it isn't sent at all
+    assert reports(client) == [
+        {'class': 'TPV', 'device': '/dev/gps0', 'lat': 55.672, 'lon': 12.521}]
+
+def test_publish_projection_both_reports(srv, clock):
+    client = watch(srv, '{"enable":true,"json":true,"fields":["mode","hdop"]}')
+    srv.publish('/dev/gps0', make_tpv())
+
+    assert reports(client) == [
+        {'class': 'TPV', 'device': '/dev/gps0', 'mode': 3},
+        {'class': 'SKY', 'device': '/dev/gps0', 'hdop': 0.8}]
+
+def test_publish_shares_payload(srv, clock, monkeypatch):
+    encoded = []
+    encode = Subscription.encode
+
+    def counting_encode(sub, msgs):
+        ret = encode(sub, msgs)
+        encoded.append((sub, ret))
+        return ret
+
+    monkeypatch.setattr(Subscription, 'encode', counting_encode)
+
+    fast = [watch(srv, '{"enable":true,"json":true}') for _ in range(3)]
+    slow = [watch(srv, '{"enable":true,"json":true,"fields":["lat"]}') for _ in range(2)]
+    srv.publish('/dev/gps0', make_tpv())
+
+    # Once per distinct subscription, not per client
+    assert sorted(sub.fields is None for (sub, _) in encoded) == [False, True]
+
+    payloads = dict(encoded)
+    for client in fast:
+        assert client.out_buff == payloads[Subscription.ALL]
+    for client in slow:
+        assert client.out_buff == payloads[Subscription(0.0, frozenset(['lat']))]
+
+def test_publish_rate(srv, clock):
+    every = watch(srv, '{"enable":true,"json":true}')
+    once = watch(srv, '{"enable":true,"json":true,"rate":1}')
+    tpv = make_tpv()
+
+    sent = []
+    for offset in [0.0, 0.3, 0.6, 0.99, 1.0, 1.2, 1.5, 2.05, 2.5, 3.0]:
+        clock.now = 1000.0 + offset
+        srv.publish('/dev/gps0', tpv)
+        if any(msg['class'] == 'TPV' for msg in reports(once)):
+            sent.append(offset)
+
+    # On a 1 s grid from the first report
+    assert sent == [0.0, 1.0, 2.05, 3.0]
+    assert len(reports(every)) == 2 * 10
+
+def test_publish_rate_after_gap(srv, clock):
+    once = watch(srv, '{"enable":true,"json":true,"rate":1}')
+    tpv = make_tpv()
+
+    sent = []
+    for offset in [0.0, 5.5, 6.0, 6.5]:
+        clock.now = 1000.0 + offset
+        srv.publish('/dev/gps0', tpv)
+        if reports(once):
+            sent.append(offset)
+
+    # Fallen off the grid, so it restarts from the late epoch
+    assert sent == [0.0, 5.5, 6.5]
@@ -0,0 +1,149 @@
+import pytest
+
+from fixated.nmea import nmea_sat_id
+from fixated.file_parser import FileNmeaParser, _EpochSink, iter_tpvs
+from fixated.datatypes import GnssId
+
+def nmea_sentence(body):
+    csum = 0
+    for char in body.encode():
+        csum ^= char
+    return '$%s*%02X' % (body, csum)
+
+def parse(*bodies):
+    '''
+    Feeds sentences to a fresh parser, returning the epoch in progress.
+    '''
+    parser = FileNmeaParser(_EpochSink(), 'test')
+    for body in bodies:
+        parser.parse(nmea_sentence(body))
+
+    return parser.incoming_tpv
+
+def sats(tpv):
+    return {key: (sat.nmea_id, sat.elevation, sat.azimuth, sat.snr, sat.used)
+            for (key, sat) in tpv.satellites.items()}
+
+@pytest.mark.parametrize('talker, nmea_id, expected', [
+    # Mixed talkers go by the extended NMEA ranges
+    (None, 1, (GnssId.GPS, 1)),
+    (None, 32, (GnssId.GPS, 32)),
+    (None, 33, (GnssId.SBAS, 120)),
+    (None, 64, (GnssId.SBAS, 151)),
+    (None, 65, (GnssId.GLONASS, 1)),
+    (None, 96, (GnssId.GLONASS, 32)),
+    (None, 131, (GnssId.SBAS, 131)),
+    (None, 193, (GnssId.QZSS, 1)),
+    (None, 201, (GnssId.BEIDOU, 1)),
+    (None, 301, (GnssId.GALILEO, 1)),
+    # So do GP ones, which some receivers use for SBAS
+    (GnssId.GPS, 5, (GnssId.GPS, 5)),
+    (GnssId.GPS, 46, (GnssId.SBAS, 133)),
+    # Talker specific, numbered per constellation...
+    (GnssId.GLONASS, 1, (GnssId.GLONASS, 1)),
+    (GnssId.GALILEO, 5, (GnssId.GALILEO, 5)),
+    (GnssId.BEIDOU, 12, (GnssId.BEIDOU, 12)),
+    # ...or in the extended range
+    (GnssId.GLONASS, 65, (GnssId.GLONASS, 1)),
+    (GnssId.GALILEO, 305, (GnssId.GALILEO, 5)),
+    (GnssId.BEIDOU, 212, (GnssId.BEIDOU, 12)),
+])
+def test_nmea_sat_id(talker, nmea_id, expected):
+    assert nmea_sat_id(talker, nmea_id) == expected
+
+def test_gsa_talker():
+    tpv = parse('GLGSA,A,3,01,02,,,,,,,,,,,1.8,0.8,1.6')
+    assert set(tpv.satellites) == {(GnssId.GLONASS, 1), (GnssId.GLONASS, 2)}
+    assert all(sat.used for sat in tpv.satellites.values())
+
+@pytest.mark.parametrize('system_id, gnssid', [
+    ('1', GnssId.GPS),
+    ('2', GnssId.GLONASS),
+    ('3', GnssId.GALILEO),
+    ('4', GnssId.BEIDOU),
+])
+def test_gsa_system_id(system_id, gnssid):
+    tpv = parse('GNGSA,A,3,05,07,,,,,,,,,,,1.8,0.8,1.6,%s' % system_id)
+    assert set(tpv.satellites) == {(gnssid, 5), (gnssid, 7)}
+    assert (tpv.pdop, tpv.hdop, tpv.vdop) == ('1.8', '0.8', '1.6')
+
+def test_gsa_without_system_id():
+    # Pre 4.11 GN sentences only have the extended ranges to go by
+    tpv = parse('GNGSA,A,3,05,70,305,,,,,,,,,,1.8,0.8,1.6')
+    assert set(tpv.satellites) == {
+        (GnssId.GPS, 5), (GnssId.GLONASS, 6), (GnssId.GALILEO, 5)}
+
+def test_gsv():
+    tpv = parse('GPGSV,1,1,03,05,45,100,40,07,30,200,35,46,20,150,')
+    assert sats(tpv) == {
+        (GnssId.GPS, 5): (5, 45, 100, 40, False),
+        (GnssId.GPS, 7): (7, 30, 200, 35, False),
+        (GnssId.SBAS, 133): (46, 20, 150, None, False),
+    }
+
+@pytest.mark.parametrize('count', [1, 2, 3, 4])
+def test_gsv_signal_id(count):
+    blocks = ['%02d,%d,%d,%d' % (idx + 1, 10 + idx, 100 + idx, 30 + idx)
+              for idx in range(count)]
+    tpv = parse('GAGSV,1,1,%02d,%s,7' % (count, ','.join(blocks)))
+
+    assert sats(tpv) == {
+        (GnssId.GALILEO, idx + 1): (idx + 1, 10 + idx, 100 + idx, 30 + idx, False)
+        for idx in range(count)}
+
+def test_same_prn_different_gnss():
+    tpv = parse('GPGSV,1,1,01,05,45,100,40',
+                'GAGSV,1,1,01,05,30,200,35,7',
+                'GPGSA,A,3,05,,,,,,,,,,,,1.8,0.8,1.6,1',
+                'GNGSA,A,3,05,,,,,,,,,,,,1.8,0.8,1.6,3')
+
+    assert sats(tpv) == {
+        (GnssId.GPS, 5): (5, 45, 100, 40, True),
+        (GnssId.GALILEO, 5): (5, 30, 200, 35, True),
+    }
+
+def test_gpsd_sky():
+    tpv = parse('GPGSV,1,1,02,05,45,100,40,46,20,150,33',
+                'GLGSV,1,1,01,70,35,120,31',
+                'GAGSV,1,1,01,05,30,200,35,7',
+                'GBGSV,1,1,01,12,60,300,42')
+
+    sky = tpv.gpsd_sky('test')
+    assert sorted((sat['gnssid'], sat['svid'], sat['PRN']) for sat in sky['satellites']) == [
+        (0, 5, 5),
+        (1, 133, 133),
+        (2, 5, 305),
+        (3, 12, 212),
+        (6, 6, 70),
+    ]
+
+def test_mixed_epoch(tmp_path):
+    # GN position, and per constellation satellites, like a modern receiver
+    epoch = [
+        'GNRMC,%s,A,5540.3220,N,01231.2858,E,1.06,86.57,041112,,,A',
+        'GNGGA,%s,5540.3252,N,01231.2946,E,1,10,0.8,36.1,M,41.5,M,,0000',
+        'GNGSA,A,3,05,07,,,,,,,,,,,1.8,0.8,1.6,1',
+        'GNGSA,A,3,70,,,,,,,,,,,,1.8,0.8,1.6,2',
+        'GNGSA,A,3,05,,,,,,,,,,,,1.8,0.8,1.6,3',
+        'GPGSV,1,1,02,05,45,100,40,07,30,200,35',
+        'GLGSV,1,1,01,70,35,120,31',
+        'GAGSV,1,1,01,05,30,200,35,7',
+        'GBGSV,1,1,01,12,60,300,42',
+    ]
+    path = tmp_path / 'mixed.log'
+    with open(str(path), 'w') as fh:
+        for sec in range(10):
+            stamp = '1347%02d.000' % sec
+            for body in epoch:
+                fh.write(nmea_sentence(body.replace('%s', stamp)) + '\n')
+
+    tpvs = list(iter_tpvs(str(path)))
+    assert tpvs
+
+    assert sats(tpvs[-1]) == {
+        (GnssId.GPS, 5): (5, 45, 100, 40, True),
+        (GnssId.GPS, 7): (7, 30, 200, 35, True),
+        (GnssId.GLONASS, 6): (70, 35, 120, 31, True),
+        (GnssId.GALILEO, 5): (5, 30, 200, 35, True),
+        (GnssId.BEIDOU, 12): (12, 60, 300, 42, False),
+    }
@@ -0,0 +1,84 @@
+import os
+import random
+
+import pytest
+
+from fixated import parallel_parser
+from fixated.parallel_parser import parse_log, parse_log_columns, tpvs_to_columns
+from fixated.file_parser import iter_tpvs
+
+LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'sample_nmea', 'GPS_20121104_134730.log')
+
+CHUNK_SIZES = [200, 1000, 5000, 1 << 20]
+WORKERS = [1, 3, 8]
+
+def nmea_sentence(body):
+    csum = 0
+    for char in body.encode():
+        csum ^= char
+    return '$%s*%02X' % (body, csum)
+
+@pytest.fixture(scope='module')
+def gbs_log(tmp_path_factory):
+    '''
+    The sample log, with GBS sentences sprinkled in, so the error estimates
+    have to be carried across chunk borders.
+    '''
+    rand = random.Random(1)
+    path = str(tmp_path_factory.mktemp('logs') / 'gbs.log')
+    with open(LOG) as fh, open(path, 'w') as out:
+        for line in fh:
+            out.write(line)
+            if rand.random() < 0.01:
+                out.write(nmea_sentence('GPGBS,134731.00,%.1f,%.1f,%.1f,,,,' % (
+                          rand.random() * 9, rand.random() * 9, rand.random() * 9)))
+                out.write('\n')
+
+    return path
+
+@pytest.fixture(params=CHUNK_SIZES)
+def chunk_size(request, monkeypatch):
+    monkeypatch.setattr(parallel_parser, 'MIN_CHUNK_SIZE', request.param)
+    return request.param
+
+def epoch(tpv):
+    sats = sorted((key, sat.nmea_id, sat.elevation, sat.azimuth, sat.snr, sat.used)
+                  for (key, sat) in tpv.satellites.items())
+
+    return (tpv.dt, tpv.lat_dec, tpv.lon_dec, tpv.alt,
+            tpv.epx, tpv.epy, tpv.epv,
+            tpv.fix_dim, tpv.fix_quality,
+            tpv.hdop, tpv.vdop, tpv.pdop,
+            sats)
+
+def columns_bytes(cols):
+    # Compare the raw bytes, so NaNs match NaNs
+    return {name: col.tobytes() for (name, col) in cols.items()}
+
+@pytest.mark.parametrize('workers', WORKERS)
+@pytest.mark.parametrize('log', ['sample', 'gbs'])
+def test_parse_log_matches_sequential(log, workers, chunk_size, gbs_log):
+    path = LOG if log == 'sample' else gbs_log
+
+    expected = [epoch(tpv) for tpv in iter_tpvs(path)]
+    assert expected
+
+    assert [epoch(tpv) for tpv in parse_log(path, workers=workers)] == expected
+
+@pytest.mark.parametrize('workers', WORKERS)
+@pytest.mark.parametrize('log', ['sample', 'gbs'])
+def test_parse_log_columns_matches_sequential(log, workers, chunk_size, gbs_log):
+    path = LOG if log == 'sample' else gbs_log
+
+    expected = tpvs_to_columns(list(iter_tpvs(path)))
+    assert len(expected['lat'])
+
+    actual = parse_log_columns(path, workers=workers)
+    assert columns_bytes(actual) == columns_bytes(expected)
+
+def test_gbs_log_has_gbs(gbs_log):
+    # Otherwise the GBS cases above prove nothing
+    tpvs = list(iter_tpvs(gbs_log))
+    assert any(tpv.epx is not None for tpv in tpvs)
+    assert tpvs[0].epx is None